@@ -45,10 +45,11 @@ def load(
         return num
 
     fmt, nodecount, edges, varcount = fp.readline().split()
-    node_specs = dict(enumerate(line.split() for line in fp))
     assert fmt == 'nnf'
     nodes = {}  # type: t.Dict[int, NNF]
-    for num, spec in node_specs.items():
+    # Nodes only refer to earlier nodes, so they can be built as they're read
+    for num, line in enumerate(fp):
+        spec = line.split()
         if spec[0] == 'L':
             if spec[1].startswith('-'):
                 nodes[num] = Var(decode_name(int(spec[1][1:])), False)
@@ -1,4 +1,6 @@
 import copy
+import functools
+import os
 import pathlib
 import pickle
 import platform
@@ -28,7 +30,10 @@ for method in memoized:
 
 settings.register_profile('patient', deadline=2000,
                           suppress_health_check=(HealthCheck.too_slow,))
-settings.load_profile('patient')
+# Reproducible runs on CI, without consulting the example database
+settings.register_profile('ci', settings.get_profile('patient'),
+                          derandomize=True)
+settings.load_profile('ci' if os.environ.get('CI') else 'patient')
 
 a, b, c = Var('a'), Var('b'), Var('c')
 
@@ -36,19 +41,34 @@ fig1a = (~a & b) | (a & ~b)
 fig1b = (~a | ~b) & (a | b)
 
 satlib = pathlib.Path(__file__).parent / "testdata" / "satlib"
-uf20 = [dsharp.load(file.open()) for file in (satlib / "uf20").glob("*.nnf")]
-uf20_cnf = [
-    dimacs.load(file.open()) for file in (satlib / "uf20").glob("*.cnf")
-]  # type: t.List[And[Or[Var]]]
 
 # Test config default value before the tests start mucking with the state
 assert config.sat_backend == "auto"
 
 
+uf20_files = sorted((satlib / "uf20").glob("*.nnf"))
+
+
+@pytest.fixture(scope="session", params=uf20_files,
+                ids=lambda file: file.stem)
+def uf20_sentence(request):
+    with request.param.open() as f:
+        return dsharp.load(f)
+
+
+@pytest.fixture(scope="session")
+def uf20_cnf() -> t.List[And[Or[Var]]]:
+    sentences = []
+    for file in sorted((satlib / "uf20").glob("*.cnf")):
+        with file.open() as f:
+            sentences.append(dimacs.load(f))
+    return sentences
+
+
 def test_all_models_basic():
     assert list(nnf.all_models([])) == [{}]
     assert list(nnf.all_models([1])) == [{1: False}, {1: True}]
-    assert len(list(nnf.all_models(range(10)))) == 1024
+    assert sum(1 for _ in nnf.all_models(range(10))) == 1024
 
 
 @given(st.sets(st.integers(), max_size=8))
@@ -64,7 +84,10 @@ def test_all_models(names):
     assert all(len(model) == len(names)
                for model in result)
     # No duplicate models
-    assert len({tuple(model.items()) for model in result}) == len(result)
+    # (read values in a fixed order, dict order isn't guaranteed to match)
+    order = tuple(names)
+    rows = {tuple(model[name] for name in order) for model in result}
+    assert len(rows) == len(result)
 
 
 def test_basic():
@@ -89,76 +112,66 @@ def test_amc():
 names = st.integers(1, 8)
 
 
-@st.composite
-def variables(draw):
-    return Var(draw(names), draw(st.booleans()))
+def variables():
+    return st.builds(Var, names, st.booleans())
+
+
+def booleans():
+    return st.sampled_from((nnf.true, nnf.false))
 
 
-@st.composite
-def booleans(draw):
-    return draw(st.sampled_from((nnf.true, nnf.false)))
+def leaves():
+    return st.one_of(variables(), booleans())
 
 
-@st.composite
-def leaves(draw):
-    return draw(st.one_of(variables(), booleans()))
+def terms():
+    return st.dictionaries(names, st.booleans()).map(
+        lambda model: And(Var(name, value) for name, value in model.items())
+    )
 
 
-@st.composite
-def terms(draw):
-    return And(Var(name, draw(st.booleans()))
-               for name in draw(st.sets(names)))
+def clauses():
+    return st.dictionaries(names, st.booleans()).map(
+        lambda model: Or(Var(name, value) for name, value in model.items())
+    )
 
 
-@st.composite
-def clauses(draw):
-    return Or(Var(name, draw(st.booleans()))
-              for name in draw(st.sets(names)))
+def DNF():
+    return st.frozensets(terms()).map(Or)
 
 
-@st.composite
-def DNF(draw):
-    return Or(draw(st.frozensets(terms())))
+def CNF():
+    return st.frozensets(clauses()).map(And)
 
 
-@st.composite
-def CNF(draw):
-    sentence = And(draw(st.frozensets(clauses())))
-    return sentence
+def full_term(values):
+    return And(Var(name, value) for name, value in enumerate(values, 1))
 
 
-@st.composite
-def models(draw):
-    return And(
-        Var(name, draw(st.booleans()))
-        for name in range(1, draw(st.integers(min_value=1, max_value=9)))
-    )
+def models():
+    return st.lists(st.booleans(), max_size=8).map(full_term)
 
 
-@st.composite
-def MODS(draw):
-    num = draw(st.integers(min_value=1, max_value=9))
-    amount = draw(st.integers(min_value=0, max_value=10))
-    return Or(And(Var(name, draw(st.booleans()))
-                  for name in range(1, num))
-              for _ in range(amount))
+def MODS():
+    return st.integers(min_value=0, max_value=8).flatmap(
+        lambda num: st.lists(
+            st.lists(st.booleans(), min_size=num, max_size=num),
+            max_size=10,
+        )
+    ).map(lambda rows: Or(full_term(row) for row in rows))
 
 
-@st.composite
-def internal(draw, children):
-    return draw(st.sampled_from((And, Or)))(draw(st.frozensets(children)))
+def internal(children):
+    return st.one_of(st.frozensets(children).map(And),
+                     st.frozensets(children).map(Or))
 
 
-@st.composite
-def NNF(draw):
-    return draw(st.recursive(variables(), internal))
+def NNF():
+    return st.recursive(variables(), internal)
 
 
-@st.composite
-def DNNF(draw):
-    sentence = draw(NNF())
-    assume(sentence.decomposable())
-    return sentence
+def DNNF():
+    return NNF().filter(lambda sentence: sentence.decomposable())
 
 
 @given(DNF())
@@ -177,6 +190,7 @@ def test_MODS(sentence: nnf.Or):
     assert sentence.simply_conjunct()
 
 
+@settings(max_examples=200)
 @given(MODS())
 def test_MODS_satisfiable(sentence: nnf.Or):
     if len(sentence.children) > 0:
@@ -190,8 +204,10 @@ def merge_nodes(request):
     return request.param
 
 
+@settings(max_examples=25)
 @given(sentence=DNNF())
 def test_DNNF_sat_strategies(sentence: nnf.NNF, merge_nodes):
+    # Simplification alone decides satisfiability for DNNF
     sat = sentence.satisfiable()
     if sat:
         assert sentence.simplify(merge_nodes) != nnf.false
@@ -203,66 +219,51 @@ def test_DNNF_sat_strategies(sentence: nnf.NNF, merge_nodes):
         event("Sentence not satisfiable")
 
 
-def test_amc_numsat():
-    for sentence in uf20:
-        assert (amc.NUM_SAT(sentence.make_smooth())
-                == len(list(sentence.models())))
+def test_amc_numsat(uf20_sentence: nnf.NNF):
+    assert (amc.NUM_SAT(uf20_sentence.make_smooth())
+            == sum(1 for _ in uf20_sentence.models()))
 
 
 @given(sentence=NNF())
-def test_idempotent_simplification(sentence: nnf.NNF, merge_nodes):
-    sentence = sentence.simplify(merge_nodes)
-    assert sentence.simplify(merge_nodes) == sentence
-
+def test_simplify(sentence: nnf.NNF, merge_nodes):
+    has_booleans = has_mergeable = False
+    for node in sentence.walk():
+        if node == nnf.true or node == nnf.false:
+            has_booleans = True
+        elif not has_mergeable and isinstance(node, nnf.Internal):
+            has_mergeable = any(type(node) == type(child)
+                                for child in node.children)
+        if has_booleans and has_mergeable:
+            break
+    if has_booleans:
+        event("Sentence contained booleans originally")
+    if has_mergeable:
+        event("Sentence contained immediately mergeable nodes")
+        # Nodes may also be merged after intermediate nodes are removed
 
-@given(sentence=NNF())
-def test_simplify_preserves_meaning(sentence: nnf.NNF, merge_nodes):
     simple = sentence.simplify(merge_nodes)
+
+    # Idempotent
+    assert simple.simplify(merge_nodes) == simple
+
+    # Preserves meaning
     assert sentence.equivalent(simple)
     for model in sentence.models():
         assert simple.satisfied_by(model)
     for model in simple.models():
         assert sentence.condition(model).simplify(merge_nodes) == nnf.true
 
-
-@given(sentence=NNF())
-def test_simplify_eliminates_bools(sentence: nnf.NNF, merge_nodes):
-    assume(sentence != nnf.true and sentence != nnf.false)
-    if any(node == nnf.true or node == nnf.false
-           for node in sentence.walk()):
-        event("Sentence contained booleans originally")
-    sentence = sentence.simplify(merge_nodes)
-    if sentence == nnf.true or sentence == nnf.false:
+    # Eliminates booleans, and merges internal nodes if asked to
+    if simple == nnf.true or simple == nnf.false:
         event("Sentence simplified to boolean")
-    else:
-        for node in sentence.walk():
-            assert node != nnf.true and node != nnf.false
-
-
-@given(NNF())
-def test_simplify_merges_internal_nodes(sentence: nnf.NNF):
-    if any(any(type(node) == type(child)
-               for child in node.children)
-           for node in sentence.walk()
-           if isinstance(node, nnf.Internal)):
-        event("Sentence contained immediately mergeable nodes")
-        # Nodes may also be merged after intermediate nodes are removed
-    for node in sentence.simplify().walk():
-        if isinstance(node, nnf.Internal):
+        return
+    for node in simple.walk():
+        assert node != nnf.true and node != nnf.false
+        if merge_nodes and isinstance(node, nnf.Internal):
             for child in node.children:
                 assert type(node) != type(child)
 
 
-@given(sentence=DNNF())
-def test_simplify_solves_DNNF_satisfiability(sentence: nnf.NNF, merge_nodes):
-    if sentence.satisfiable():
-        event("Sentence is satisfiable")
-        assert sentence.simplify(merge_nodes) != nnf.false
-    else:
-        event("Sentence is not satisfiable")
-        assert sentence.simplify(merge_nodes) == nnf.false
-
-
 def test_dimacs_sat_serialize():
     # http://www.domagoj-babic.com/uploads/ResearchProjects/Spear/dimacs-cnf.pdf
     sample_input = """c Sample SAT format
@@ -309,15 +310,31 @@ def test_dimacs_rejects_weird_digits():
         dimacs.loads("p cnf 1 1\n¹ 0")
 
 
-@given(NNF())
-def test_arbitrary_dimacs_sat_serialize(sentence: nnf.NNF):
-    assert dimacs.loads(dimacs.dumps(sentence)) == sentence
+def check_dimacs_sat_serialize(sentence: nnf.NNF):
+    serial = dimacs.dumps(sentence)
+    assert dimacs.loads(serial) == sentence
     # Removing spaces may change the meaning, but shouldn't make it invalid
     # At least as far as our parser is concerned, a more sophisticated one
     # could detect variables with too high names
-    serial = dimacs.dumps(sentence).split('\n')
-    serial[1] = serial[1].replace(' ', '')
-    dimacs.loads('\n'.join(serial))
+    lines = serial.split('\n')
+    lines[1] = lines[1].replace(' ', '')
+    dimacs.loads('\n'.join(lines))
+
+
+@pytest.mark.parametrize(
+    'sentence',
+    [nnf.true, nnf.false, Var(1), ~Var(1), And({Var(2)}), Or({nnf.true})]
+)
+def test_small_dimacs_sat_serialize(sentence: nnf.NNF):
+    check_dimacs_sat_serialize(sentence)
+
+
+@given(NNF())
+def test_arbitrary_dimacs_sat_serialize(sentence: nnf.NNF):
+    # Small sentences are covered by test_small_dimacs_sat_serialize
+    assume(sentence.size() >= 4)
+    event("Sentence size {}".format(sentence.size()))
+    check_dimacs_sat_serialize(sentence)
 
 
 @given(CNF())
@@ -360,19 +377,28 @@ def test_dsharp_output():
         clauses = dimacs.load(f)
     assert sentence.decomposable()
     # this is not a complete check, but clauses.models() is very expensive
-    assert all(clauses.satisfied_by(model) for model in sentence.models())
+    # each clause is a set of (name, value) pairs, satisfied by a model if
+    # it shares at least one pair with the model's items
+    literals = [frozenset((var.name, var.true) for var in clause)
+                for clause in clauses]
+    for model in sentence.models():
+        assert not any(model.items().isdisjoint(clause)
+                       for clause in literals)
 
 
 @given(NNF())
 def test_walk_unique_nodes(sentence: nnf.NNF):
-    result = list(sentence.walk())
-    assert len(result) == len(set(result))
-    assert len(result) <= sentence.size() + 1
+    seen = set()  # type: t.Set[nnf.NNF]
+    for node in sentence.walk():
+        assert node not in seen
+        seen.add(node)
+    assert len(seen) <= sentence.size() + 1
 
 
+@settings(max_examples=200)
 @given(st.dictionaries(st.integers(), st.booleans()))
 def test_to_model(model: dict):
-    sentence = nnf.And(nnf.Var(k, v) for k, v in model.items())
+    sentence = nnf.And([nnf.Var(k, v) for k, v in model.items()])
     assert sentence.to_model() == model
 
 
@@ -468,6 +494,7 @@ def test_random_equivalent(a: nnf.NNF, b: nnf.NNF):
             assert model_set(a.models()) != model_set(b.models())
 
 
+@settings(max_examples=50)
 @given(NNF())
 def test_smoothing(sentence: nnf.NNF):
     if not sentence.smooth():
@@ -476,10 +503,14 @@ def test_smoothing(sentence: nnf.NNF):
         assert type(sentence) is type(smoothed)
         assert smoothed.smooth()
         assert sentence.equivalent(smoothed)
-        assert smoothed.make_smooth() == smoothed
+        # Smooth sentences usually come back as the very same object, which
+        # saves a full structural comparison
+        again = smoothed.make_smooth()
+        assert again is smoothed or again == smoothed
     else:
         event("Sentence already smooth")
-        assert sentence.make_smooth() == sentence
+        again = sentence.make_smooth()
+        assert again is sentence or again == sentence
 
 
 def hashable_dict(model):
@@ -490,14 +521,25 @@ def model_set(model_gen):
     return frozenset(map(hashable_dict, model_gen))
 
 
-def test_uf20_models():
-
-    for sentence in uf20:
-        assert sentence.decomposable()
-        m = list(sentence._models_decomposable())
-        models = model_set(m)
-        assert len(m) == len(models)
-        assert models == model_set(sentence._models_deterministic())
+def test_uf20_models(uf20_sentence: nnf.NNF):
+    assert uf20_sentence.decomposable()
+    expected = set()
+    count = 0
+    for model in uf20_sentence._models_decomposable():
+        expected.add(hashable_dict(model))
+        count += 1
+    assert count == len(expected)
+    # Move models from expected to seen as they show up, so together the
+    # two sets never hold more than the reference models
+    seen = set()
+    for model in uf20_sentence._models_deterministic():
+        key = hashable_dict(model)
+        if key in expected:
+            expected.remove(key)
+            seen.add(key)
+        else:
+            assert key in seen
+    assert not expected
 
 
 def test_instantiating_base_classes_fails():
@@ -509,6 +551,7 @@ def test_instantiating_base_classes_fails():
         nnf.Internal({nnf.Var(3)})
 
 
+@settings(max_examples=50)
 @given(NNF())
 def test_negation(sentence: nnf.NNF):
     n_vars = len(sentence.vars())
@@ -520,42 +563,98 @@ def test_negation(sentence: nnf.NNF):
 
 @given(NNF())
 def test_model_counting(sentence: nnf.NNF):
-    assert sentence.model_count() == len(list(sentence.models()))
+    assert sentence.model_count() == sum(1 for _ in sentence.models())
+
+
+def test_uf20_model_counting(uf20_sentence: nnf.NNF):
+    nnf.NNF._deterministic_sentences.pop(id(uf20_sentence), None)
+    assert uf20_sentence.model_count() == sum(
+        1 for _ in uf20_sentence.models()
+    )
+    uf20_sentence.mark_deterministic()
+    assert uf20_sentence.model_count() == sum(
+        1 for _ in uf20_sentence.models()
+    )
+
+
+def truth_table(sentence: nnf.NNF) -> t.Tuple[int, int]:
+    """Evaluate a sentence on every model of its variables at once.
+
+    Bit ``i`` of a table stands for the ``i``th model, so each node is
+    evaluated with a single bitwise operation per child. Returns the table
+    of the sentence and the table that's true everywhere.
+    """
+    names = list(sentence.vars())
+    everything = (1 << (1 << len(names))) - 1
+    columns = {}
+    for index, name in enumerate(names):
+        # Runs of 2**index false models followed by 2**index true models
+        period = 1 << (index + 1)
+        run = ((1 << (1 << index)) - 1) << (1 << index)
+        columns[name] = everything // ((1 << period) - 1) * run
+
+    @functools.lru_cache(maxsize=None)
+    def table(node: nnf.NNF) -> int:
+        if isinstance(node, Var):
+            column = columns[node.name]
+            return column if node.true else everything ^ column
+        elif isinstance(node, And):
+            result = everything
+            for child in node.children:
+                result &= table(child)
+            return result
+        elif isinstance(node, Or):
+            result = 0
+            for child in node.children:
+                result |= table(child)
+            return result
+        raise TypeError(node)
+
+    return table(sentence), everything
 
 
-def test_uf20_model_counting():
-    for sentence in uf20:
-        nnf.NNF._deterministic_sentences.pop(id(sentence), None)
-        assert sentence.model_count() == len(list(sentence.models()))
-        sentence.mark_deterministic()
-        assert sentence.model_count() == len(list(sentence.models()))
+def test_truth_table():
+    assert truth_table(nnf.true) == (1, 1)
+    assert truth_table(nnf.false) == (0, 1)
+    table, everything = truth_table(fig1a)
+    negated = truth_table(fig1a.negate())[0]
+    assert bin(table).count("1") == 2
+    assert table | negated == everything
+    assert table & negated == 0
+    # Asymmetric sentences catch columns that are wrong or repeated
+    assert bin(truth_table(a & ~b)[0]).count("1") == 1
+    assert bin(truth_table(a | b)[0]).count("1") == 3
+    assert bin(truth_table(a & (b | ~c))[0]).count("1") == 3
+    assert bin(truth_table(a | (~b & c))[0]).count("1") == 5
 
 
 @given(NNF())
 def test_validity(sentence: nnf.NNF):
+    table, everything = truth_table(sentence)
     if sentence.valid():
         event("Valid sentence")
-        assert all(sentence.satisfied_by(model)
-                   for model in nnf.all_models(sentence.vars()))
+        assert table == everything
     else:
         event("Invalid sentence")
-        assert any(not sentence.satisfied_by(model)
-                   for model in nnf.all_models(sentence.vars()))
+        assert table != everything
 
 
-def test_uf20_validity():
-    for sentence in uf20:
-        nnf.NNF._deterministic_sentences.pop(id(sentence), None)
-        assert not sentence.valid()
-        sentence.mark_deterministic()
-        assert not sentence.valid()
+def test_uf20_validity(uf20_sentence: nnf.NNF):
+    nnf.NNF._deterministic_sentences.pop(id(uf20_sentence), None)
+    assert not uf20_sentence.valid()
+    uf20_sentence.mark_deterministic()
+    assert not uf20_sentence.valid()
 
 
-@given(CNF())
-def test_is_CNF(sentence: nnf.NNF):
-    assert sentence.is_CNF()
-    assert sentence.is_CNF(strict=True)
-    assert not sentence.is_DNF()
+@given(st.one_of(CNF().map(lambda sentence: ("CNF", sentence)),
+                 DNF().map(lambda sentence: ("DNF", sentence))))
+def test_is_CNF_or_DNF(drawn: t.Tuple[str, nnf.NNF]):
+    form, sentence = drawn
+    event("{} sentence".format(form))
+    assert sentence.is_CNF() == (form == "CNF")
+    assert sentence.is_CNF(strict=True) == (form == "CNF")
+    assert sentence.is_DNF() == (form == "DNF")
+    assert sentence.is_DNF(strict=True) == (form == "DNF")
 
 
 def test_is_CNF_examples():
@@ -569,13 +668,6 @@ def test_is_CNF_examples():
     assert not And({Or({a, ~b}), Or({c, ~c})}).is_CNF(strict=True)
 
 
-@given(DNF())
-def test_is_DNF(sentence: nnf.NNF):
-    assert sentence.is_DNF()
-    assert sentence.is_DNF(strict=True)
-    assert not sentence.is_CNF()
-
-
 def test_is_DNF_examples():
     assert Or().is_DNF()
     assert Or().is_DNF(strict=True)
@@ -689,7 +781,7 @@ def test_implies(a: nnf.NNF, b: nnf.NNF):
                    for model in a.models())
 
 
-def test_uf20_cnf_sat():
+def test_uf20_cnf_sat(uf20_cnf):
     for sentence in uf20_cnf:
         assert sentence.is_CNF()
         assert sentence.satisfiable()
@@ -775,9 +867,10 @@ def test_forget(sentence: nnf.NNF):
 @given(NNF())
 def test_project(sentence: nnf.NNF):
     # Test that we get the same as projecting and forgetting
-    assume(len(sentence.vars()) > 3)
-    vars1 = list(sentence.vars())[:2]
-    vars2 = list(sentence.vars())[2:]
+    names = list(sentence.vars())
+    assume(len(names) > 3)
+    vars1 = names[:2]
+    vars2 = names[2:]
     assert sentence.forget(vars1).equivalent(sentence.project(vars2))
 
 
@@ -796,7 +889,7 @@ def test_copying_does_not_copy(sentence: nnf.NNF):
 
 
 if shutil.which('dsharp') is not None:
-    def test_dsharp_compile_uf20():
+    def test_dsharp_compile_uf20(uf20_cnf):
         sentence = uf20_cnf[0]
         compiled = dsharp.compile(sentence)
         compiled_smooth = dsharp.compile(sentence, smooth=True)
@@ -887,20 +980,21 @@ def test_tseitin_required_detection():
 def test_complete_models(model: nnf.And[nnf.Var]):
     m = {v.name: v.true for v in model}
     neg = {v.name: not v.true for v in model}
+    names = model.vars()
 
-    zero = list(complete_models([m], model.vars()))
+    zero = list(complete_models([m], names))
     assert len(zero) == 1
 
-    one = list(complete_models([m], model.vars() | {"test1"}))
+    one = list(complete_models([m], names | {"test1"}))
     assert len(one) == 2
 
-    two = list(complete_models([m], model.vars() | {"test1", "test2"}))
+    two = list(complete_models([m], names | {"test1", "test2"}))
     assert len(two) == 4
     assert all(x.keys() == m.keys() | {"test1", "test2"} for x in two)
 
     if m:
         multi = list(
-            complete_models([m, neg], model.vars() | {"test1", "test2"})
+            complete_models([m, neg], names | {"test1", "test2"})
         )
         assert len(multi) == 8
         assert len({frozenset(x.items()) for x in multi}) == 8  # all unique
@@ -910,7 +1004,7 @@ def test_complete_models(model: nnf.And[nnf.Var]):
 if (platform.uname().system, platform.uname().machine) == ('Linux', 'x86_64'):
 
     @config(sat_backend="kissat")
-    def test_kissat_uf20():
+    def test_kissat_uf20(uf20_cnf):
         for sentence in uf20_cnf:
             assert sentence.satisfiable()
 
@@ -1079,7 +1173,7 @@ if pysat.available:
                 assert sentence._cnf_satisfiable_native()
                 assert pysat.satisfiable(sentence)
 
-    def test_pysat_uf20(pysat_solver):
+    def test_pysat_uf20(uf20_cnf, pysat_solver):
         with pysat_solver:
             for sentence in uf20_cnf:
                 assert pysat.satisfiable(sentence)